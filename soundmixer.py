@@ -4,24 +4,29 @@ import os
 import logging
 import threading
 import time
-import keyboard
+import ctypes
+from ctypes import wintypes
+from enum import IntEnum
 from PyQt5.QtWidgets import (
     QApplication, QSystemTrayIcon, QMenu, QDialog, 
     QVBoxLayout, QLabel, QPushButton, QHBoxLayout,
     QMessageBox, QComboBox, QWidget, QProgressBar, 
-    QAction, QStyle
+    QAction
 )
-from PyQt5.QtGui import QIcon, QKeySequence, QFont
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtGui import QIcon, QKeySequence, QFont, QPixmap
+from PyQt5.QtCore import Qt, QAbstractNativeEventFilter, QTimer, pyqtSignal
+import win32api
 import win32gui
 import win32process
 import win32con
-import pyautogui
-import psutil
 
-# Настройка логирования
+# Настройка логирования (уровень можно переопределить через SOUNDMIXER_LOGLEVEL)
+LOG_LEVEL = getattr(logging, os.environ.get("SOUNDMIXER_LOGLEVEL", "INFO").upper(), None)
+if not isinstance(LOG_LEVEL, int):
+    LOG_LEVEL = logging.INFO
+
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=LOG_LEVEL,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
         logging.FileHandler("sound_mixer.log"),
@@ -29,6 +34,151 @@ logging.basicConfig(
     ]
 )
 
+CONFIG_IO_BUFFER = 65536
+
+VOLUME_STEP = 0.05
+# Не чаще одного изменения громкости за кадр (~30 FPS) при зажатой клавише
+VOLUME_FLUSH_INTERVAL = 33
+
+# Модификаторы, которые отпускаются перед имитацией Alt+Tab: (virtual-key, флаги keybd_event)
+RELEASED_MODIFIERS = (
+    (win32con.VK_LCONTROL, 0),
+    (win32con.VK_RCONTROL, win32con.KEYEVENTF_EXTENDEDKEY),
+    (win32con.VK_LSHIFT, 0),
+    (win32con.VK_RSHIFT, 0),
+    (win32con.VK_LWIN, win32con.KEYEVENTF_EXTENDEDKEY),
+    (win32con.VK_RWIN, win32con.KEYEVENTF_EXTENDEDKEY)
+)
+
+# Через сколько мс после имитации Alt+Tab снова регистрировать hotkey switch_app
+SWITCH_APP_REARM_DELAY = 100
+
+PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+# Предельная длина пути в Windows (32767 символов + NUL), а не MAX_PATH
+MAX_LONG_PATH = 32768
+
+# Время жизни кэшей hwnd -> pid и pid -> имя процесса (в секундах)
+HWND_PID_CACHE_TTL = 2.0
+PID_NAME_CACHE_TTL = 30.0
+# Активное окно переиспользуется контроллером и оверлеем в пределах одного кадра
+FOREGROUND_CACHE_TTL = 0.05
+
+COINIT_MULTITHREADED = 0x0
+AUDIO_SESSION_STATE_EXPIRED = 2
+EDATAFLOW_RENDER = 0
+EROLE_MULTIMEDIA = 1
+
+MODIFIER_FLAGS = {
+    "ctrl": win32con.MOD_CONTROL,
+    "alt": win32con.MOD_ALT,
+    "shift": win32con.MOD_SHIFT,
+    "win": win32con.MOD_WIN
+}
+
+# Названия клавиш в формате QKeySequence(...).toString().lower()
+VIRTUAL_KEYS = {
+    "up": win32con.VK_UP,
+    "down": win32con.VK_DOWN,
+    "left": win32con.VK_LEFT,
+    "right": win32con.VK_RIGHT,
+    "tab": win32con.VK_TAB,
+    "space": win32con.VK_SPACE,
+    "return": win32con.VK_RETURN,
+    "enter": win32con.VK_RETURN,
+    "esc": win32con.VK_ESCAPE,
+    "backspace": win32con.VK_BACK,
+    "ins": win32con.VK_INSERT,
+    "del": win32con.VK_DELETE,
+    "home": win32con.VK_HOME,
+    "end": win32con.VK_END,
+    "pgup": win32con.VK_PRIOR,
+    "pgdown": win32con.VK_NEXT
+}
+
+# Иконка динамика 16x16 для трея (PNG)
+_TRAY_ICON_PNG = (
+    b'\x89\x50\x4e\x47\x0d\x0a\x1a\x0a\x00\x00\x00\x0d\x49\x48\x44\x52'
+    b'\x00\x00\x00\x10\x00\x00\x00\x10\x08\x06\x00\x00\x00\x1f\xf3\xff'
+    b'\x61\x00\x00\x00\x44\x49\x44\x41\x54\x78\xda\x63\x60\x18\xf4\xc0'
+    b'\x67\x7d\xc0\x7f\x8a\x34\xa3\x1b\x80\x4d\x0c\xaf\x66\x6c\x8a\x09'
+    b'\x1a\x82\xac\x19\x59\x21\x2e\x36\x56\x4d\xb8\x0c\x80\xf1\xc9\x32'
+    b'\x00\x59\x23\x86\x1c\x5d\x0c\xc0\xeb\x05\x8a\x03\x91\xaa\xd1\x48'
+    b'\x95\x84\x44\x95\xa4\x4c\x17\x00\x00\xd6\x0c\xa4\xd1\x5f\x4e\x37'
+    b'\x49\x00\x00\x00\x00\x49\x45\x4e\x44\xae\x42\x60\x82'
+)
+
+LAYOUT_INDEPENDENT_KEYS = frozenset("abcdefghijklmnopqrstuvwxyz0123456789")
+
+EVENT_SYSTEM_FOREGROUND = 0x0003
+WINEVENT_OUTOFCONTEXT = 0x0000
+
+WinEventProcType = ctypes.WINFUNCTYPE(
+    None,
+    wintypes.HANDLE,
+    wintypes.DWORD,
+    wintypes.HWND,
+    wintypes.LONG,
+    wintypes.LONG,
+    wintypes.DWORD,
+    wintypes.DWORD
+)
+
+# Собственный экземпляр библиотеки: прототипы на общем ctypes.windll.user32
+# повлияли бы на любой другой код в процессе.
+# Явные прототипы нужны, иначе HWINEVENTHOOK обрезается до int на 64-битном Python
+_user32 = ctypes.WinDLL("user32", use_last_error=True)
+_user32.SetWinEventHook.restype = wintypes.HANDLE
+_user32.SetWinEventHook.argtypes = (
+    wintypes.DWORD,
+    wintypes.DWORD,
+    wintypes.HMODULE,
+    WinEventProcType,
+    wintypes.DWORD,
+    wintypes.DWORD,
+    wintypes.DWORD
+)
+_user32.UnhookWinEvent.restype = wintypes.BOOL
+_user32.UnhookWinEvent.argtypes = (wintypes.HANDLE,)
+
+_kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+_kernel32.OpenProcess.restype = wintypes.HANDLE
+_kernel32.OpenProcess.argtypes = (wintypes.DWORD, wintypes.BOOL, wintypes.DWORD)
+_kernel32.QueryFullProcessImageNameW.restype = wintypes.BOOL
+_kernel32.QueryFullProcessImageNameW.argtypes = (
+    wintypes.HANDLE,
+    wintypes.DWORD,
+    wintypes.LPWSTR,
+    ctypes.POINTER(wintypes.DWORD)
+)
+_kernel32.CloseHandle.restype = wintypes.BOOL
+_kernel32.CloseHandle.argtypes = (wintypes.HANDLE,)
+
+def parse_hotkey(combo):
+    """Преобразует строку вида 'ctrl+alt+up' в (модификаторы, virtual-key) для RegisterHotKey"""
+    modifiers = 0
+    vk = None
+    for key in combo.lower().split('+'):
+        if key in MODIFIER_FLAGS:
+            modifiers |= MODIFIER_FLAGS[key]
+        elif key in VIRTUAL_KEYS:
+            vk = VIRTUAL_KEYS[key]
+        elif len(key) > 1 and key[0] == 'f' and key[1:].isdigit() and 1 <= int(key[1:]) <= 24:
+            vk = win32con.VK_F1 + int(key[1:]) - 1
+        elif len(key) == 1 and key in LAYOUT_INDEPENDENT_KEYS:
+            # VK-коды латинских букв и цифр совпадают с их ASCII в верхнем регистре
+            vk = ord(key.upper())
+        elif len(key) == 1:
+            # VkKeyScan зависит от активной раскладки, поэтому только для знаков препинания
+            scan = win32api.VkKeyScan(key)
+            if scan == -1:
+                raise ValueError(f"Unknown key: {key}")
+            vk = scan & 0xFF
+        else:
+            raise ValueError(f"Unknown key: {key}")
+    if vk is None:
+        raise ValueError("No main key in combination")
+    return modifiers, vk
+
 class ConfigManager:
     def __init__(self, config_path='config.json'):
         self.config_path = config_path
@@ -44,14 +194,16 @@ class ConfigManager:
                 "timeout": 2000
             }
         }
+        self._dirty = False
         self.config = self.load_config()
+        self.build_combo_strings()
         logging.info("Config loaded")
     
     def load_config(self):
         if os.path.exists(self.config_path):
             try:
-                with open(self.config_path, 'r') as f:
-                    return json.load(f)
+                with open(self.config_path, 'rb', buffering=CONFIG_IO_BUFFER) as f:
+                    return json.loads(f.read())
             except json.JSONDecodeError as e:
                 logging.error(f"Invalid JSON in config: {e}")
                 self.create_default_config()
@@ -63,38 +215,76 @@ class ConfigManager:
             self.create_default_config()
             return self.default_config
     
+    def write_config(self, config):
+        """Сериализуем целиком и пишем одним вызовом write"""
+        payload = json.dumps(config, indent=4).encode('utf-8')
+        with open(self.config_path, 'wb', buffering=CONFIG_IO_BUFFER) as f:
+            f.write(payload)
+    
     def create_default_config(self):
         try:
-            with open(self.config_path, 'w') as f:
-                json.dump(self.default_config, f, indent=4)
+            self.write_config(self.default_config)
             logging.info("Default config created")
         except Exception as e:
             logging.error(f"Error creating config: {e}")
     
     def save_config(self):
         try:
-            with open(self.config_path, 'w') as f:
-                json.dump(self.config, f, indent=4)
+            self.write_config(self.config)
+            self._dirty = False
             logging.info("Config saved")
         except Exception as e:
             logging.error(f"Error saving config: {e}")
     
+    def flush(self):
+        """Записываем отложенные изменения, если они есть"""
+        if self._dirty:
+            self.save_config()
+    
+    def build_combo_strings(self):
+        """Строки комбинаций вида 'ctrl+alt+up' считаем один раз после загрузки"""
+        self._combo_strings = {
+            action: '+'.join(keys).lower()
+            for action, keys in self.config["hotkeys"].items()
+        }
+    
     def get_hotkey(self, action):
         keys = self.config["hotkeys"].get(action, [])
         return keys
     
+    def get_hotkey_combo(self, action):
+        return self._combo_strings.get(action, "")
+    
     def set_hotkey(self, action, keys):
         self.config["hotkeys"][action] = keys
-        self.save_config()
+        self._combo_strings[action] = '+'.join(keys).lower()
+        # Запись на диск откладываем, чтобы не блокировать GUI-поток
+        if not self._dirty:
+            self._dirty = True
+            QTimer.singleShot(0, self.flush)
     
     def get_gui_setting(self, setting):
         return self.config["gui"].get(setting, self.default_config["gui"][setting])
 
 class AudioController:
     def __init__(self):
+        self._session_map = {}  # pid -> ISimpleAudioVolume
+        self._session_lock = threading.Lock()
+        self._session_manager = None
+        self.volume_interface = None
+        self._hwnd_pid_cache = {}  # hwnd -> (pid, время получения)
+        self._fg_cache = (0, 0.0, None)  # hwnd, время получения, pid
+        
+        # Активация COM занимает десятки мс - не задерживаем появление иконки в трее
+        self.init_thread = threading.Thread(target=self.initialize_in_background, daemon=True)
+        self.init_thread.start()
+    
+    def initialize_in_background(self):
+        # comtypes инициализирует COM в потоке, который первым его импортирует.
+        # Нужен MTA: интерфейсы и callback'и сессий должны пережить этот поток
+        sys.coinit_flags = COINIT_MULTITHREADED
         self.initialize_audio()
-        self.current_pid = None
-        self.current_volume_control = None
+        self.init_session_map()
     
     def initialize_audio(self):
         try:
@@ -113,26 +303,149 @@ class AudioController:
             logging.error(f"Failed to initialize audio controller: {e}")
             self.volume_interface = None
     
-    def get_volume_control_for_app(self, pid):
-        """Получаем интерфейс управления громкостью для конкретного приложения"""
-        from pycaw.pycaw import AudioUtilities
+    def init_session_map(self):
+        """Подписываемся на аудиосессии и на смену устройства вывода по умолчанию"""
+        try:
+            from pycaw.pycaw import AudioSession, AudioUtilities, IAudioSessionControl2
+            from pycaw.callbacks import (
+                AudioSessionEvents, AudioSessionNotification, MMNotificationClient
+            )
+            
+            controller = self
+            
+            class SessionEvents(AudioSessionEvents):
+                def __init__(self, pid, volume):
+                    super().__init__()
+                    self.pid = pid
+                    self.volume = volume
+                
+                def on_state_changed(self, new_state, new_state_id):
+                    if new_state_id == AUDIO_SESSION_STATE_EXPIRED:
+                        controller.remove_session(self.pid, self.volume)
+                
+                def on_session_disconnected(self, disconnect_reason, disconnect_reason_id):
+                    controller.remove_session(self.pid, self.volume)
+            
+            class SessionNotification(AudioSessionNotification):
+                def on_session_created(self, new_session):
+                    try:
+                        ctl = new_session.QueryInterface(IAudioSessionControl2)
+                        controller.add_session(AudioSession(ctl), SessionEvents)
+                    except Exception as e:
+                        logging.error(f"Error handling new audio session: {e}")
+            
+            class DeviceNotification(MMNotificationClient):
+                def on_default_device_changed(self, flow, flow_id, role, role_id, default_device_id):
+                    # Уведомление приходит по разу на каждую роль - реагируем на ту,
+                    # которую использует AudioUtilities.GetSpeakers()
+                    if flow_id == EDATAFLOW_RENDER and role_id == EROLE_MULTIMEDIA:
+                        # Внутри callback'а нельзя блокироваться и пересоздавать подписки
+                        threading.Thread(target=controller.on_default_device_changed, daemon=True).start()
+            
+            self._session_events_class = SessionEvents
+            self._session_notification = SessionNotification()
+            self._device_notification = DeviceNotification()
+            self._device_enumerator = AudioUtilities.GetDeviceEnumerator()
+            self._device_enumerator.RegisterEndpointNotificationCallback(self._device_notification)
+        except Exception as e:
+            logging.error(f"Failed to initialize audio session map: {e}")
+            return
         
+        self.rebuild_session_map()
+    
+    def rebuild_session_map(self):
+        """Заполняем карту сессий заново для текущего устройства вывода по умолчанию"""
         try:
-            sessions = AudioUtilities.GetAllSessions()
-            for session in sessions:
-                if session.Process and session.ProcessId == pid:
-                    return session.SimpleAudioVolume
-            return None
+            from pycaw.pycaw import AudioSession, AudioUtilities, IAudioSessionControl2
+            
+            if self._session_manager is not None:
+                self._session_manager.UnregisterSessionNotification(self._session_notification)
+                self._session_manager = None
+            with self._session_lock:
+                self._session_map.clear()
+            
+            # Подписка и перечисление идут через один и тот же менеджер: уведомления
+            # гарантированы только после GetSessionEnumerator на нём, а подписка
+            # до перечисления не оставляет окна, в котором новая сессия теряется
+            manager = AudioUtilities.GetAudioSessionManager()
+            manager.RegisterSessionNotification(self._session_notification)
+            self._session_manager = manager
+            
+            enumerator = manager.GetSessionEnumerator()
+            for i in range(enumerator.GetCount()):
+                ctl = enumerator.GetSession(i).QueryInterface(IAudioSessionControl2)
+                self.add_session(AudioSession(ctl), self._session_events_class)
+            logging.info(f"Audio session map initialized ({len(self._session_map)} sessions)")
         except Exception as e:
-            logging.error(f"Error getting volume control for app: {e}")
-            return None
+            logging.error(f"Failed to build audio session map: {e}")
+    
+    def on_default_device_changed(self):
+        import comtypes
+        
+        comtypes.CoInitializeEx(comtypes.COINIT_MULTITHREADED)
+        logging.info("Default audio device changed, rebuilding session map")
+        self.initialize_audio()
+        self.rebuild_session_map()
+    
+    def add_session(self, session, events_class):
+        from pycaw.pycaw import ISimpleAudioVolume
+        
+        if not session.Process:
+            return
+        pid = session.ProcessId
+        # Храним сам COM-указатель, чтобы вызовы громкости шли без обёртки pycaw
+        volume = session._ctl.QueryInterface(ISimpleAudioVolume)
+        session.register_notification(events_class(pid, volume))
+        with self._session_lock:
+            self._session_map[pid] = volume
+    
+    def remove_session(self, pid, volume):
+        with self._session_lock:
+            if self._session_map.get(pid) is volume:
+                del self._session_map[pid]
+    
+    def get_volume_control_for_app(self, pid):
+        """Получаем интерфейс управления громкостью для конкретного приложения"""
+        return self._session_map.get(pid)
+    
+    def get_pid_for_hwnd(self, hwnd):
+        """Получаем PID владельца окна с кэшированием на HWND_PID_CACHE_TTL секунд"""
+        now = time.monotonic()
+        cached = self._hwnd_pid_cache.get(hwnd)
+        if cached and now - cached[1] < HWND_PID_CACHE_TTL:
+            return cached[0]
+        
+        # Устаревшие записи выбрасываем, чтобы кэш не рос за время работы
+        for stale_hwnd in [h for h, (_, ts) in self._hwnd_pid_cache.items()
+                           if now - ts >= HWND_PID_CACHE_TTL]:
+            del self._hwnd_pid_cache[stale_hwnd]
+        
+        _, pid = win32process.GetWindowThreadProcessId(hwnd)
+        self._hwnd_pid_cache[hwnd] = (pid, now)
+        return pid
+    
+    def _refresh_foreground(self):
+        """Активное окно и его PID, общие для всех вызовов в пределах одного кадра"""
+        hwnd, ts, pid = self._fg_cache
+        now = time.monotonic()
+        if now - ts < FOREGROUND_CACHE_TTL:
+            return hwnd, pid
+        
+        hwnd = win32gui.GetForegroundWindow()
+        pid = self.get_pid_for_hwnd(hwnd)
+        self._fg_cache = (hwnd, now, pid)
+        return hwnd, pid
+    
+    def invalidate_foreground(self):
+        self._fg_cache = (0, 0.0, None)
+    
+    def get_cached_hwnd(self):
+        return self._refresh_foreground()[0]
     
     def get_active_app_pid(self):
         """Получаем PID активного приложения"""
         try:
-            hwnd = win32gui.GetForegroundWindow()
-            _, pid = win32process.GetWindowThreadProcessId(hwnd)
-            return pid
+            return self._refresh_foreground()[1]
         except Exception as e:
             logging.error(f"Error getting active app PID: {e}")
             return None
@@ -145,13 +458,12 @@ class AudioController:
                 logging.warning("No active app PID found")
                 return
                 
-            # Если приложение изменилось, получаем новый интерфейс
-            if pid != self.current_pid:
-                self.current_volume_control = self.get_volume_control_for_app(pid)
-                self.current_pid = pid
-                
-            if self.current_volume_control:
-                self.current_volume_control.SetMasterVolume(max(0.0, min(1.0, level)), None)
+            # Поиск по карте сессий дешёвый, поэтому интерфейс между вызовами не кэшируем:
+            # сессия могла истечь и быть заменена новой у того же процесса
+            volume_control = self.get_volume_control_for_app(pid)
+            
+            if volume_control:
+                volume_control.SetMasterVolume(max(0.0, min(1.0, level)), None)
             elif self.volume_interface:
                 # Если не нашли интерфейс для приложения, используем общий
                 self.volume_interface.SetMasterVolume(max(0.0, min(1.0, level)), None)
@@ -165,13 +477,12 @@ class AudioController:
             if not pid:
                 return 0.5
                 
-            # Если приложение изменилось, получаем новый интерфейс
-            if pid != self.current_pid:
-                self.current_volume_control = self.get_volume_control_for_app(pid)
-                self.current_pid = pid
-                
-            if self.current_volume_control:
-                return self.current_volume_control.GetMasterVolume()
+            # Поиск по карте сессий дешёвый, поэтому интерфейс между вызовами не кэшируем:
+            # сессия могла истечь и быть заменена новой у того же процесса
+            volume_control = self.get_volume_control_for_app(pid)
+            
+            if volume_control:
+                return volume_control.GetMasterVolume()
             elif self.volume_interface:
                 return self.volume_interface.GetMasterVolume()
             return 0.5
@@ -186,14 +497,13 @@ class AudioController:
             if not pid:
                 return
                 
-            # Если приложение изменилось, получаем новый интерфейс
-            if pid != self.current_pid:
-                self.current_volume_control = self.get_volume_control_for_app(pid)
-                self.current_pid = pid
-                
-            if self.current_volume_control:
-                is_muted = self.current_volume_control.GetMute()
-                self.current_volume_control.SetMute(not is_muted, None)
+            # Поиск по карте сессий дешёвый, поэтому интерфейс между вызовами не кэшируем:
+            # сессия могла истечь и быть заменена новой у того же процесса
+            volume_control = self.get_volume_control_for_app(pid)
+            
+            if volume_control:
+                is_muted = volume_control.GetMute()
+                volume_control.SetMute(not is_muted, None)
             elif self.volume_interface:
                 is_muted = self.volume_interface.GetMute()
                 self.volume_interface.SetMute(not is_muted, None)
@@ -201,29 +511,72 @@ class AudioController:
             logging.error(f"Error toggling mute: {e}")
 
 class VolumeOverlay(QWidget):
+    foreground_changed = pyqtSignal()
+    
     def __init__(self, audio_controller, config_manager):
         super().__init__()
         self.audio = audio_controller
         self.config = config_manager
+        self._cached_hwnd = None
+        self._cached_app_name = None
+        self._last_volume = None
+        self._pid_name_cache = {}  # pid -> (имя процесса, время получения)
         self.init_ui()
-        self.update_info()
         
         self.hide_timer = QTimer(self)
         self.hide_timer.timeout.connect(self.hide)
         self.hide_timer.setSingleShot(True)
         
+        # Таймер работает только пока оверлей видим (см. show_overlay/hideEvent)
         self.update_timer = QTimer(self)
+        self.update_timer.setInterval(500)
         self.update_timer.timeout.connect(self.update_info)
-        self.update_timer.start(500)
+        
+        self.foreground_changed.connect(self.on_foreground_changed)
+        self.install_foreground_hook()
+    
+    def install_foreground_hook(self):
+        """Подписка на смену активного окна вместо опроса GetForegroundWindow"""
+        # Ссылку на callback нужно хранить, иначе ctypes освободит его
+        self._win_event_proc = WinEventProcType(self._on_win_event)
+        self._win_event_hook = _user32.SetWinEventHook(
+            EVENT_SYSTEM_FOREGROUND,
+            EVENT_SYSTEM_FOREGROUND,
+            0,
+            self._win_event_proc,
+            0,
+            0,
+            WINEVENT_OUTOFCONTEXT
+        )
+        if not self._win_event_hook:
+            logging.error("Failed to install foreground window hook")
+    
+    def remove_foreground_hook(self):
+        if getattr(self, "_win_event_hook", None):
+            _user32.UnhookWinEvent(self._win_event_hook)
+            self._win_event_hook = None
+    
+    def _on_win_event(self, hWinEventHook, event, hwnd, idObject, idChild, dwEventThread, dwmsEventTime):
+        self.foreground_changed.emit()
+    
+    def on_foreground_changed(self):
+        self.audio.invalidate_foreground()
+        self._cached_hwnd = None
+        self._cached_app_name = None
+        self.update_info()
     
     def init_ui(self):
         self.setWindowFlags(
             Qt.FramelessWindowHint |
             Qt.WindowStaysOnTopHint |
             Qt.Tool |
-            Qt.X11BypassWindowManagerHint
+            Qt.X11BypassWindowManagerHint |
+            Qt.WindowDoesNotAcceptFocus
         )
         self.setAttribute(Qt.WA_TranslucentBackground)
+        # Оверлей не должен становиться активным окном, иначе следующее нажатие
+        # горячей клавиши отнесётся к самому SoundMixer, а не к целевому приложению
+        self.setAttribute(Qt.WA_ShowWithoutActivating)
         self.setStyleSheet("background: transparent;")
         
         container = QWidget(self)
@@ -277,111 +630,255 @@ class VolumeOverlay(QWidget):
         self.move(screen.width() - self.width() - 20, 50)
     
     def update_info(self):
+        # Скрытый оверлей обновлять незачем: данные обновятся в show_overlay
+        if not self.isVisible():
+            return
+        
         try:
             # Получаем название активного приложения
-            hwnd = win32gui.GetForegroundWindow()
-            app_name = win32gui.GetWindowText(hwnd).strip()
-            
-            # Если название пустое, пытаемся получить имя процесса
-            if not app_name:
-                try:
-                    _, pid = win32process.GetWindowThreadProcessId(hwnd)
-                    process = psutil.Process(pid)
-                    app_name = process.name()
-                except:
+            hwnd = self.audio.get_cached_hwnd()
+            if hwnd != self._cached_hwnd or not self._cached_app_name:
+                app_name = win32gui.GetWindowText(hwnd).strip()
+                
+                # Если название пустое, пытаемся получить имя процесса
+                if not app_name:
+                    try:
+                        pid = self.audio.get_pid_for_hwnd(hwnd)
+                        app_name = self.get_process_name(pid)
+                    except:
+                        app_name = "System"
+                
+                if not app_name:
                     app_name = "System"
-            
-            if not app_name:
-                app_name = "System"
-            
-            if len(app_name) > 40:
-                app_name = app_name[:37] + "..."
-            
-            self.app_label.setText(app_name)
+                
+                if len(app_name) > 40:
+                    app_name = app_name[:37] + "..."
+                
+                self._cached_hwnd = hwnd
+                self._cached_app_name = app_name
+                self.app_label.setText(app_name)
         except Exception as e:
             logging.error(f"Error getting active app: {e}")
+            self._cached_hwnd = None
             self.app_label.setText("Unknown App")
         
         try:
             volume = int(self.audio.get_volume() * 100)
-            self.volume_bar.setValue(volume)
-            self.volume_label.setText(f"{volume}%")
+            # Виджеты трогаем только при изменении, чтобы не вызывать лишнюю перерисовку
+            if volume != self._last_volume:
+                self._last_volume = volume
+                self.volume_bar.setValue(volume)
+                self.volume_label.setText(f"{volume}%")
         except Exception as e:
             logging.error(f"Error getting volume: {e}")
+            self._last_volume = None
             self.volume_label.setText("Error")
     
+    def get_process_name(self, pid):
+        """Имя исполняемого файла процесса с кэшированием на PID_NAME_CACHE_TTL секунд"""
+        now = time.monotonic()
+        cached = self._pid_name_cache.get(pid)
+        if cached and now - cached[1] < PID_NAME_CACHE_TTL:
+            return cached[0]
+        
+        # Устаревшие записи выбрасываем, чтобы кэш не рос с переиспользованием PID
+        for stale_pid in [p for p, (_, ts) in self._pid_name_cache.items()
+                          if now - ts >= PID_NAME_CACHE_TTL]:
+            del self._pid_name_cache[stale_pid]
+        
+        # Достаточно LIMITED-доступа, так что имя читается и у повышенных процессов
+        handle = _kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            raise ctypes.WinError(ctypes.get_last_error())
+        try:
+            buf = ctypes.create_unicode_buffer(MAX_LONG_PATH)
+            size = wintypes.DWORD(MAX_LONG_PATH)
+            if not _kernel32.QueryFullProcessImageNameW(handle, 0, buf, ctypes.byref(size)):
+                raise ctypes.WinError(ctypes.get_last_error())
+        finally:
+            _kernel32.CloseHandle(handle)
+        
+        name = os.path.basename(buf.value)
+        self._pid_name_cache[pid] = (name, now)
+        return name
+    
     def show_overlay(self, timeout=None):
         if timeout is None:
             timeout = self.config.get_gui_setting("timeout")
         self.show()
         self.raise_()
-        self.activateWindow()
+        
+        if not self.update_timer.isActive():
+            self.update_info()
+            self.update_timer.start()
         
         if self.hide_timer.isActive():
             self.hide_timer.stop()
         
         self.hide_timer.start(timeout)
+    
+    def hideEvent(self, event):
+        self.update_timer.stop()
+        super().hideEvent(event)
+
+class HotkeyAction(IntEnum):
+    VOLUME_UP = 0
+    VOLUME_DOWN = 1
+    MUTE = 2
+    SWITCH_APP = 3
+
+# Имена действий в config.json, в порядке HotkeyAction
+_ACTION_NAMES = ("volume_up", "volume_down", "mute", "switch_app")
+
+class HotkeyEventFilter(QAbstractNativeEventFilter):
+    """Перехватывает WM_HOTKEY в очереди сообщений GUI-потока"""
+    def __init__(self, manager):
+        super().__init__()
+        self.manager = manager
+
+    def nativeEventFilter(self, eventType, message):
+        if eventType == b"windows_generic_MSG":
+            msg = wintypes.MSG.from_address(int(message))
+            if msg.message == win32con.WM_HOTKEY:
+                self.manager.dispatch(msg.wParam)
+                return True, 0
+        return False, 0
 
 class HotkeyManager:
     def __init__(self, config_manager):
         self.config_manager = config_manager
-        self.hotkeys = {}
+        self.hotkeys = {}  # id -> (combo, modifiers, vk, callback)
         self.active = False
-        self.callbacks = {
-            "volume_up": lambda: None,
-            "volume_down": lambda: None,
-            "mute": lambda: None,
-            "switch_app": lambda: None
-        }
+        self._suspend_reload = False
+        self.callbacks = [lambda: None] * len(HotkeyAction)
+        # Id 1..N закреплены за действиями (HotkeyAction + 1), остальные выдаются register_hotkey
+        self._next_id = len(HotkeyAction) + 1
+        self._registered = {}  # id -> (modifiers, vk)
+        self._event_filter = HotkeyEventFilter(self)
         self.load_hotkeys()
         logging.info("HotkeyManager initialized")
 
     def load_hotkeys(self):
-        for action in self.callbacks.keys():
-            keys = self.config_manager.get_hotkey(action)
-            if keys:
-                combo = '+'.join(keys)
-                self.register_hotkey(combo, self.callbacks[action])
-                logging.debug(f"Registered hotkey for {action}: {combo}")
+        for action in HotkeyAction:
+            name = _ACTION_NAMES[action]
+            combo = self.config_manager.get_hotkey_combo(name)
+            if combo:
+                self._bind(action + 1, combo, self.callbacks[action])
+                if logging.getLogger().isEnabledFor(logging.DEBUG):
+                    logging.debug(f"Registered hotkey for {name}: {combo}")
 
-    def register_hotkey(self, combo, callback):
+    def _bind(self, hotkey_id, combo, callback):
         try:
-            keyboard.add_hotkey(combo, callback)
-            self.hotkeys[combo] = callback
-            logging.debug(f"Registered hotkey combination: {combo}")
-        except Exception as e:
+            modifiers, vk = parse_hotkey(combo)
+        except ValueError as e:
             logging.error(f"Error registering hotkey {combo}: {e}")
+            return False
+        self.hotkeys[hotkey_id] = (combo, modifiers, vk, callback)
+        return True
+
+    def register_hotkey(self, combo, callback):
+        hotkey_id = self._next_id
+        self._next_id += 1
+        if not self._bind(hotkey_id, combo, callback):
+            return None
+        if self.active:
+            self._sync_registrations()
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(f"Registered hotkey combination: {combo}")
+        return hotkey_id
 
     def update_hotkeys(self):
-        keyboard.unhook_all_hotkeys()
-        self.hotkeys.clear()
+        for action in HotkeyAction:
+            self.hotkeys.pop(action + 1, None)
         self.load_hotkeys()
+        if self.active:
+            self._sync_registrations()
         logging.info("Hotkeys updated")
 
+    def _sync_registrations(self):
+        """Перерегистрирует только те id, чья комбинация изменилась"""
+        wanted = {
+            hotkey_id: (modifiers, vk)
+            for hotkey_id, (_, modifiers, vk, _) in self.hotkeys.items()
+        }
+        for hotkey_id, binding in list(self._registered.items()):
+            if wanted.get(hotkey_id) != binding:
+                win32gui.UnregisterHotKey(None, hotkey_id)
+                del self._registered[hotkey_id]
+        for hotkey_id, binding in wanted.items():
+            if hotkey_id not in self._registered:
+                self._register(hotkey_id, binding)
+
+    def _register(self, hotkey_id, binding):
+        try:
+            # hwnd=None: WM_HOTKEY попадает в очередь GUI-потока, которую разбирает Qt
+            win32gui.RegisterHotKey(None, hotkey_id, *binding)
+            self._registered[hotkey_id] = binding
+        except Exception as e:
+            logging.error(f"Error registering hotkey {self.hotkeys[hotkey_id][0]}: {e}")
+
+    def _unregister_all(self):
+        for hotkey_id in self._registered:
+            win32gui.UnregisterHotKey(None, hotkey_id)
+        self._registered.clear()
+
+    def suspend_action(self, action):
+        """Временно снимает регистрацию действия, чтобы имитируемые нажатия не совпали с ним"""
+        hotkey_id = HotkeyAction(action) + 1
+        if self._registered.pop(hotkey_id, None) is not None:
+            win32gui.UnregisterHotKey(None, hotkey_id)
+
+    def resume_action(self, action):
+        """Возвращает регистрацию, снятую suspend_action"""
+        hotkey_id = HotkeyAction(action) + 1
+        entry = self.hotkeys.get(hotkey_id)
+        if self.active and entry and hotkey_id not in self._registered:
+            self._register(hotkey_id, (entry[1], entry[2]))
+
+    def dispatch(self, hotkey_id):
+        # Вызывается из nativeEventFilter: необработанное исключение там
+        # приводит к qFatal и аварийному завершению процесса
+        try:
+            if hotkey_id <= len(self.callbacks):
+                self.callbacks[hotkey_id - 1]()
+                return
+            entry = self.hotkeys.get(hotkey_id)
+            if entry:
+                entry[3]()
+        except Exception as e:
+            logging.error(f"Error in hotkey callback {hotkey_id}: {e}")
+
     def start(self):
         if self.active:
             return
             
         self.active = True
         logging.info("Starting hotkey listener")
-        
-        def run():
-            logging.info("Hotkey listener thread started")
-            keyboard.wait()
-        
-        self.thread = threading.Thread(target=run, daemon=True)
-        self.thread.start()
+        QApplication.instance().installNativeEventFilter(self._event_filter)
+        self._sync_registrations()
 
     def stop(self):
         logging.info("Stopping hotkey listener")
-        keyboard.unhook_all_hotkeys()
+        self._unregister_all()
+        QApplication.instance().removeNativeEventFilter(self._event_filter)
         self.active = False
 
     def set_callback(self, action, callback):
-        if action in self.callbacks:
-            self.callbacks[action] = callback
-            logging.info(f"Callback set for {action}")
+        """action - HotkeyAction или имя действия из config.json"""
+        try:
+            if isinstance(action, str):
+                action = _ACTION_NAMES.index(action)
+            action = HotkeyAction(action)
+        except ValueError:
+            return
+        self.callbacks[action] = callback
+        logging.info(f"Callback set for {_ACTION_NAMES[action]}")
+        if not self._suspend_reload:
             self.update_hotkeys()
+    
+    def apply_callbacks(self):
+        """Перерегистрация горячих клавиш после пакетной установки callback'ов"""
+        self.update_hotkeys()
 
 class HotkeySettingsDialog(QDialog):
     def __init__(self, config_manager, parent=None):
@@ -408,12 +905,13 @@ class HotkeySettingsDialog(QDialog):
             
             combo = QComboBox()
             combo.setObjectName(action)
-            combo.addItem("+".join(self.config.get_hotkey(action)))
+            combo.addItem(self.config.get_hotkey_combo(action))
             self.comboboxes[action] = combo
             hbox.addWidget(combo)
             
             btn = QPushButton("Изменить")
-            btn.clicked.connect(lambda _, a=action: self.start_key_recording(a))
+            btn.setProperty("action", action)
+            btn.clicked.connect(self._on_record_clicked)
             hbox.addWidget(btn)
             
             layout.addLayout(hbox)
@@ -431,6 +929,9 @@ class HotkeySettingsDialog(QDialog):
         self.recording_action = None
         self.new_hotkey = None
     
+    def _on_record_clicked(self, _):
+        self.start_key_recording(self.sender().property("action"))
+    
     def start_key_recording(self, action):
         self.recording_action = action
         self.comboboxes[action].clear()
@@ -482,9 +983,8 @@ class HotkeySettingsDialog(QDialog):
                 self.config.set_hotkey(action, keys)
         
         QMessageBox.information(self, "Сохранено", 
-                               "Настройки сохранены. Приложение будет перезапущено.")
+                               "Настройки сохранены и применены.")
         self.accept()
-        QApplication.exit(199)
 
 class SoundMixerApp:
     def __init__(self):
@@ -495,20 +995,30 @@ class SoundMixerApp:
         self.app = QApplication(sys.argv)
         self.app.setQuitOnLastWindowClosed(False)
         
+        self._pending_delta = 0.0
+        self.volume_timer = QTimer()
+        self.volume_timer.setSingleShot(True)
+        self.volume_timer.setInterval(VOLUME_FLUSH_INTERVAL)
+        self.volume_timer.timeout.connect(self._flush_volume)
+        
         self.gui = VolumeOverlay(self.audio, self.config)
         self.gui.setWindowOpacity(self.config.get_gui_setting("opacity"))
         
-        self.hotkey_manager.set_callback("volume_up", self.volume_up)
-        self.hotkey_manager.set_callback("volume_down", self.volume_down)
-        self.hotkey_manager.set_callback("mute", self.toggle_mute)
-        self.hotkey_manager.set_callback("switch_app", self.switch_app)
+        self.hotkey_manager._suspend_reload = True
+        self.hotkey_manager.set_callback(HotkeyAction.VOLUME_UP, self.volume_up)
+        self.hotkey_manager.set_callback(HotkeyAction.VOLUME_DOWN, self.volume_down)
+        self.hotkey_manager.set_callback(HotkeyAction.MUTE, self.toggle_mute)
+        self.hotkey_manager.set_callback(HotkeyAction.SWITCH_APP, self.switch_app)
+        self.hotkey_manager._suspend_reload = False
+        self.hotkey_manager.apply_callbacks()
         
         self.tray_icon = QSystemTrayIcon()
         
         try:
-            icon = self.app.style().standardIcon(QStyle.SP_MediaVolume)
-            self.tray_icon.setIcon(icon)
-            logging.info("Standard tray icon set")
+            pixmap = QPixmap()
+            pixmap.loadFromData(_TRAY_ICON_PNG, "PNG")
+            self.tray_icon.setIcon(QIcon(pixmap))
+            logging.info("Tray icon set")
         except Exception as e:
             logging.error(f"Error setting tray icon: {e}")
         
@@ -532,11 +1042,10 @@ class SoundMixerApp:
         logging.info("SoundMixerApp initialized")
     
     def add_test_hotkey(self):
-        try:
-            keyboard.add_hotkey('ctrl+alt+t', self.test_hotkey)
+        if self.hotkey_manager.register_hotkey('ctrl+alt+t', self.test_hotkey) is None:
+            logging.error("Error registering test hotkey: Ctrl+Alt+T")
+        else:
             logging.info("Test hotkey registered: Ctrl+Alt+T")
-        except Exception as e:
-            logging.error(f"Error registering test hotkey: {e}")
     
     def test_hotkey(self):
         logging.info("TEST HOTKEY WORKED! Hotkey system is functional")
@@ -554,27 +1063,29 @@ class SoundMixerApp:
             self.gui.show_overlay()
     
     def volume_up(self):
-        logging.info("Volume up triggered")
-        try:
-            current = self.audio.get_volume()
-            new_volume = min(1.0, round(current + 0.05, 2))
-            self.audio.set_volume(new_volume)
-            QTimer.singleShot(0, self.safe_show_overlay)
-        except Exception as e:
-            logging.error(f"Error in volume_up: {e}")
+        self.queue_volume_change(VOLUME_STEP)
     
     def volume_down(self):
-        logging.info("Volume down triggered")
+        self.queue_volume_change(-VOLUME_STEP)
+    
+    def queue_volume_change(self, delta):
+        """Копим изменения от автоповтора клавиши и применяем их одним вызовом"""
+        self._pending_delta += delta
+        if not self.volume_timer.isActive():
+            self.volume_timer.start()
+    
+    def _flush_volume(self):
+        delta = self._pending_delta
+        self._pending_delta = 0.0
         try:
             current = self.audio.get_volume()
-            new_volume = max(0.0, round(current - 0.05, 2))
+            new_volume = max(0.0, min(1.0, round(current + delta, 2)))
             self.audio.set_volume(new_volume)
             QTimer.singleShot(0, self.safe_show_overlay)
         except Exception as e:
-            logging.error(f"Error in volume_down: {e}")
+            logging.error(f"Error applying volume change: {e}")
     
     def toggle_mute(self):
-        logging.info("Mute toggled")
         try:
             self.audio.toggle_mute()
             QTimer.singleShot(0, self.safe_show_overlay)
@@ -583,16 +1094,38 @@ class SoundMixerApp:
     
     def switch_app(self):
         logging.info("Switching application")
+        # Пока зажаты Ctrl+Alt, имитируемый Tab снова совпал бы с Ctrl+Alt+Tab
+        # и был бы перехвачен как WM_HOTKEY вместо переключения окна
+        self.hotkey_manager.suspend_action(HotkeyAction.SWITCH_APP)
         try:
-            pyautogui.hotkey('alt', 'tab')
+            keybd_event = _user32.keybd_event
+            # Отпускаем модификаторы самой горячей клавиши, иначе вместо Alt+Tab
+            # система получит, например, Ctrl+Alt+Tab
+            for vk, flags in RELEASED_MODIFIERS:
+                if _user32.GetAsyncKeyState(vk) & 0x8000:
+                    keybd_event(vk, 0, flags | win32con.KEYEVENTF_KEYUP, 0)
+            keybd_event(win32con.VK_MENU, 0, 0, 0)
+            keybd_event(win32con.VK_TAB, 0, 0, 0)
+            keybd_event(win32con.VK_TAB, 0, win32con.KEYEVENTF_KEYUP, 0)
+            keybd_event(win32con.VK_MENU, 0, win32con.KEYEVENTF_KEYUP, 0)
             QTimer.singleShot(0, self.safe_show_overlay)
         except Exception as e:
             logging.error(f"Error in switch_app: {e}")
+        finally:
+            # Ввод обрабатывается системой асинхронно, поэтому регистрацию
+            # возвращаем с задержкой, после того как имитируемые нажатия пройдут
+            QTimer.singleShot(
+                SWITCH_APP_REARM_DELAY,
+                lambda: self.hotkey_manager.resume_action(HotkeyAction.SWITCH_APP)
+            )
     
     def show_settings(self):
         dialog = HotkeySettingsDialog(self.config)
+        # Пока идёт запись комбинации, зарегистрированные hotkey не должны её перехватывать
+        self.hotkey_manager.stop()
         if dialog.exec_() == QDialog.Accepted:
-            os.execl(sys.executable, sys.executable, *sys.argv)
+            self.hotkey_manager.update_hotkeys()
+        self.hotkey_manager.start()
     
     def tray_icon_activated(self, reason):
         if reason == QSystemTrayIcon.DoubleClick:
@@ -600,16 +1133,19 @@ class SoundMixerApp:
     
     def quit_app(self):
         self.hotkey_manager.stop()
+        self.gui.remove_foreground_hook()
+        self.config.flush()
         self.app.quit()
     
     def run(self):
         logging.info("Sound Mixer started")
         
-        hotkeys_info = "\n".join([
-            f"{action}: {'+'.join(keys)}"
-            for action, keys in self.config.config['hotkeys'].items()
-        ])
-        logging.info(f"Active hotkeys:\n{hotkeys_info}")
+        if logging.getLogger().isEnabledFor(logging.INFO):
+            hotkeys_info = "\n".join(
+                f"{name}: {self.config.get_hotkey_combo(name)}"
+                for name in _ACTION_NAMES
+            )
+            logging.info(f"Active hotkeys:\n{hotkeys_info}")
         
         self.hotkey_manager.start()
         
@@ -632,11 +1168,5 @@ class SoundMixerApp:
         sys.exit(self.app.exec_())
 
 if __name__ == "__main__":
-    restart_code = 199
-    while True:
-        app = QApplication(sys.argv)
-        mixer = SoundMixerApp()
-        exit_code = app.exec_()
-        
-        if exit_code != restart_code:
-            break
\ No newline at end of file
+    mixer = SoundMixerApp()
+    mixer.run()
\ No newline at end of file